@@ -72,7 +72,7 @@ Initialize a subscription for modifying the spherical cursor radius.
 >>> sub = server_node.create_subscription(msg_type=radius_message,
 ...                                       topic='cursor/radius',
 ...                                       callback=callback, 
-...                                       qos_profile=qos.SYSTEM_DEFAULT.value)
+...                                       qos_profile=qos.SENSOR_DATA.value)
 
 Test the new subscription.
 
@@ -88,7 +88,7 @@ Initialize a subscription for modifying the spherical cursor position.
 >>> sub = server_node.create_subscription(msg_type=position_message,
 ...                                       topic='cursor/position',
 ...                                       callback=callback, 
-...                                       qos_profile=qos.SYSTEM_DEFAULT.value)
+...                                       qos_profile=qos.SENSOR_DATA.value)
 
 Test the subscription.
 
@@ -98,6 +98,117 @@ Test the subscription.
 >>> environment
 {'cursor': {'radius': 0.1, 'position': {'x': 0.1, 'y': -0.5, 'z': 1.0}}}
 
+Clean up the ROS2 nodes.
+
+>>> client_node.destroy_node()
+>>> server_node.destroy_node()
+
+Connect a client and a `Server` that transmit all of the property values of an 
+object in a single message, on the `{key}/state` topic of the object.
+
+>>> from ros_spheres_environment.server import Server
+>>> environment = spheres_environment.Environment()
+>>> server_node = rclpy.node.Node('server')
+>>> server = Server(node=server_node, environment=environment, state_topic=True)
+>>> client_node = rclpy.node.Node('client')
+>>> client = Environment(node=client_node, state_topic=True)
+>>> client.initialize_object('ball')
+>>> spin(client_node)
+>>> spin(server_node)
+>>> environment
+{'ball': {}}
+
+A state message is published once every object property has been set.
+
+>>> client['ball'].radius = 0.5
+>>> client['ball'].position = (1.0, 2.0, 3.0)
+>>> spin(client_node)
+>>> spin(server_node)
+>>> environment
+{'ball': {'position': {'x': 1.0, 'y': 2.0, 'z': 3.0}, 'radius': 0.5}}
+
+Clean up the ROS2 nodes.
+
+>>> client_node.destroy_node()
+>>> server_node.destroy_node()
+
+Deliver messages directly to a `Server` in the same process. Messages bypass 
+the ROS2 middleware, so the environment is modified without spinning either 
+node.
+
+>>> environment = spheres_environment.Environment()
+>>> server_node = rclpy.node.Node('server')
+>>> server = Server(node=server_node, environment=environment)
+>>> client_node = rclpy.node.Node('client')
+>>> client = Environment(node=client_node, intraprocess=True)
+>>> client.initialize_object('ball')
+>>> client['ball'].radius = 0.5
+>>> environment
+{'ball': {'radius': 0.5}}
+
+Errors raised by the server are logged, rather than raised by the client, just 
+as they would be if the message had been published. For example, the server 
+cannot destroy an object that does not exist.
+
+>>> client.destroy_object('missing')
+>>> environment
+{'ball': {'radius': 0.5}}
+
+The client mirrors the state of the remote environment. Its representation is 
+cached, and is re-generated whenever the client is modified.
+
+>>> client
+{'ball': {'radius': 0.5}}
+>>> client['ball'].radius = 0.25
+>>> client
+{'ball': {'radius': 0.25}}
+>>> del client['ball']['radius']
+>>> client
+{'ball': {}}
+>>> client.destroy_object('ball')
+>>> client
+{}
+>>> environment
+{}
+
+Clean up the ROS2 nodes.
+
+>>> client_node.destroy_node()
+>>> server_node.destroy_node()
+
+Coalesce writes, such that only the most recent value of each object property 
+is transmitted. Values are held until the client is flushed.
+
+>>> environment = spheres_environment.Environment()
+>>> server_node = rclpy.node.Node('server')
+>>> server = Server(node=server_node, environment=environment)
+>>> client_node = rclpy.node.Node('client')
+>>> client = Environment(node=client_node, intraprocess=True, coalesce=True)
+>>> client.initialize_object('ball')
+>>> client['ball'].radius = 0.1
+>>> client['ball'].radius = 0.2
+>>> environment
+{'ball': {}}
+>>> client.flush()
+>>> environment
+{'ball': {'radius': 0.2}}
+
+Pending values are also flushed automatically when the client node is spun.
+
+>>> client['ball'].radius = 0.3
+>>> spin(client_node)
+>>> environment
+{'ball': {'radius': 0.3}}
+
+Replace the node of the client. The publishers created by the previous node 
+are destroyed, and new publishers are created.
+
+>>> other_node = rclpy.node.Node('other')
+>>> client.node = other_node
+>>> client.node is other_node
+True
+>>> other_node.destroy_node()
+
 Clean up the ROS2 nodes and shut down the ROS2 interface.
 
 >>> client_node.destroy_node()
@@ -115,19 +226,38 @@ Clean up the ROS2 nodes and shut down the ROS2 interface.
 # Contact: a.whit (nml@whit.contact)
 
 
+# Standard Python imports.
+import sys
+
 # Collections / containers imports.
 from collections.abc import Mapping
 
 # ROS2 imports
 import rclpy.node
 from rclpy.qos import QoSPresetProfiles as qos
-from rosidl_runtime_py import message_to_ordereddict
 
 # spheres_environment imports
 import spheres_environment
 
 # Local imports.
 from ros_spheres_environment.messages import *
+from ros_spheres_environment import registry
+
+
+# Functions that write a property value into an existing message instance, 
+# and return the message.
+# Position values are stored as mappings with `x`, `y`, and `z` keys, so the 
+# message fields are assigned directly.
+def _write_radius(message, value):
+    message.data = value
+    return message
+
+def _write_position(message, value):
+    (message.x, message.y, message.z) = (value['x'], value['y'], value['z'])
+    return message
+
+# Mapping between object property keys and message writers.
+_MSG_WRITERS = dict(radius=_write_radius, position=_write_position)
 
 
 # Sphere client class.
@@ -135,7 +265,30 @@ class Sphere(spheres_environment.Sphere):
     """
     """
     
-    def __init__(self, *args, node, **kwargs):
+    __slots__ = ('_node', '_intraprocess', '_coalesce', '_state_topic', 
+                 '_pending', '_publishers', '_msgs', '_emit', 
+                 '_state_publisher', '_state_msg', '_state_key', 
+                 '_guard_condition', '_version')
+    """ Instance attributes are stored in slots, for faster attribute access.
+    """
+    
+    OBJECT_PROPERTIES = ('position', 'radius')
+    """ Keys of the object properties that are published to the ROS2 graph. 
+    """
+    
+    object_properties = OBJECT_PROPERTIES
+    """ Object property keys, as a tuple that is shared by all instances. """
+    
+    _object_property_keys = frozenset(OBJECT_PROPERTIES)
+    """ Set of valid object property keys, cached for fast membership tests. 
+    """
+    
+    def __init__(self, *args, node, intraprocess=False, coalesce=False, 
+                       state_topic=False, **kwargs):
+        
+        # Initialize a counter of property modifications. See 
+        # `Environment.__repr__`.
+        self._version = 0
         
         # Invoke the superclass constructor.
         super().__init__(*args, **kwargs)
@@ -143,6 +296,16 @@ class Sphere(spheres_environment.Sphere):
         # Store a local reference to the ROS2 node.
         self._node = node
         
+        # Store the intra-process delivery, write coalescing, and object 
+        # state topic flags.
+        self._intraprocess = intraprocess
+        self._coalesce = coalesce
+        self._state_topic = state_topic
+        
+        # Initialize a mapping between object property keys and values that 
+        # are waiting to be published.
+        self._pending = dict()
+        
         # Initialize publishers for all object properties.
         self._initialize_publishers()
         
@@ -156,37 +319,142 @@ class Sphere(spheres_environment.Sphere):
         # Prepare shorthand.
         create_publisher = self._node.create_publisher
         
-        # Initialize publisher map.
-        self._publisher_map = dict()
-        
-        # Define a publisher record map.
-        publisher_record_map \
-          = dict(position=dict(msg_type=position_message),
-                 radius=dict(msg_type=radius_message))
+        # Initialize mappings between object property keys and publishers, 
+        # and between object property keys and message instances.
+        self._publishers = dict()
+        self._msgs = dict()
+        
+        # Initialize a mapping between object property keys and topics.
+        # Topic strings are generated -- and interned -- only once.
+        topics = {k: sys.intern(f'{self.key}/{k}') 
+                  for k in self.OBJECT_PROPERTIES}
+        
+        # If object state messages are requested, then initialize a single 
+        # publisher -- and message instance -- for the `state` topic.
+        # Otherwise, initialize one publisher per object property.
+        self._state_publisher = None
+        self._state_msg = None
+        self._state_key = None
+        if self._state_topic:
+            self._state_publisher \
+              = create_publisher(msg_type=STATE_TOPIC_RECORD['msg_type'], 
+                                 topic=sys.intern(f'{self.key}/state'), 
+                                 qos_profile=STATE_TOPIC_RECORD['qos_profile'])
+            self._state_msg = state_message()
+            self._state_key = registry.make_key(self._node, 
+                                                self._state_publisher)
         
         # Iterate through object properties.
-        for key in self.object_properties:
+        property_keys = () if self._state_topic else self.OBJECT_PROPERTIES
+        for key in property_keys:
         
-            # Prepare keyword arguments.
-            topic = f'{self.key}/{key}'
-            defaults = dict(topic=topic, qos_profile=qos.SYSTEM_DEFAULT.value)
-            kwargs = {**defaults, **publisher_record_map[key]}
-            
             # Initialize a publisher.
-            self._publisher_map[topic] = create_publisher(**kwargs)
+            # The message type and QoS profile must match those of the 
+            # server subscription. See `messages.PROPERTY_TOPIC_RECORD_MAP`.
+            record = PROPERTY_TOPIC_RECORD_MAP[key]
+            (msg_type, qos_profile) \
+              = (record['msg_type'], record['qos_profile'])
+            self._publishers[key] = create_publisher(msg_type=msg_type, 
+                                                     topic=topics[key], 
+                                                     qos_profile=qos_profile)
+            
+            # Initialize a message instance to be re-used for every publish.
+            # The message is serialized when published, so it can safely be 
+            # modified afterwards. Messages delivered intra-process are not 
+            # serialized -- and might be retained by a subscriber -- so a new 
+            # instance is used for each of those.
+            self._msgs[key] = msg_type()
+        
+        # Define a mapping between object property keys and functions that 
+        # publish a property value. Each function closes over the publisher, 
+        # message writer, and message instance, so that no lookups or 
+        # allocations are needed when publishing.
+        # If intra-process delivery is enabled, then messages are passed 
+        # directly to any local subscriptions, via the registry. The registry 
+        # key of each publisher is generated only once.
+        make_emitter = lambda p, w, m: lambda v: p.publish(w(m, v))
+        if self._intraprocess:
+            node = self._node
+            def make_emitter(p, w, m):
+                (k, t) = (registry.make_key(node, p), type(m))
+                return lambda v: registry.deliver(k, p, w(t(), v))
+        self._emit = {key: make_emitter(publisher, 
+                                        _MSG_WRITERS[key], 
+                                        self._msgs[key])
+                      for (key, publisher) in self._publishers.items()}
+        
+        # Note that loaned (zero-copy) messages are not used, since `rclpy` 
+        # does not expose the message loaning API of `rcl`.
+        
+        # If writes are to be coalesced, then initialize a guard condition 
+        # that publishes any pending values the next time the node is spun.
+        self._guard_condition = None
+        if self._coalesce:
+            self._guard_condition \
+              = self._node.create_guard_condition(self.flush)
         
     def _destroy_publishers(self):
-        """ Destroy ROS2 publishers for all object properties. """
+        """ Destroy ROS2 publishers for all object properties. 
         
-        # Iterate through object properties.
-        for key in self.object_properties:
+        Any pending values are discarded. Repeated invocations have no effect.
+        """
         
-            # Initialize shorthand.
-            topic = f'{self.key}/{key}'
-            publisher = self._publisher_map[topic]
-            
-            # Destroy the publisher.
+        # Destroy each of the property publishers.
+        # The mapping is drained, since it cannot be modified while iterating.
+        while self._publishers:
+            (key, publisher) = self._publishers.popitem()
             self._node.destroy_publisher(publisher)
+        self._emit.clear()
+        self._pending.clear()
+        
+        # Destroy the state publisher, if one has been initialized.
+        if self._state_publisher is not None:
+            self._node.destroy_publisher(self._state_publisher)
+            self._state_publisher = None
+        
+        # Destroy the guard condition, if one has been initialized.
+        # The guard condition holds a reference to the object, via its 
+        # callback, so the object cannot be released until it is destroyed.
+        if self._guard_condition is not None:
+            self._node.destroy_guard_condition(self._guard_condition)
+            self._guard_condition = None
+    
+    def flush(self):
+        """ Publish the most recent value of every object property that has 
+            been set since the last time values were published.
+        
+        This is only necessary if writes are coalesced, in which case it is 
+        invoked automatically when the ROS2 node is spun. It can be invoked 
+        directly to publish pending values immediately.
+        """
+        
+        # Swap out the pending values, and publish them.
+        # Object state messages include all values, so only one is needed.
+        (pending, self._pending) = (self._pending, dict())
+        if self._state_publisher is not None:
+            if pending: self._publish_state()
+            return
+        for (key, value) in pending.items(): self._emit[key](value)
+    
+    def _publish_state(self):
+        """ Publish the values of all object properties in a single message. 
+            See `messages.STATE_FIELDS`.
+        """
+        
+        # A state message requires a value for every object property.
+        if not all((k in self) for k in self.OBJECT_PROPERTIES): return
+        
+        # Write the current property values to the message.
+        # A new message instance is used for intra-process delivery. See 
+        # `_initialize_publishers`.
+        message = state_message() if self._intraprocess else self._state_msg
+        values = {**self.position, 'radius': self.radius}
+        message.data = [values[f] for f in STATE_FIELDS]
+        
+        # Publish the message.
+        publisher = self._state_publisher
+        if not self._intraprocess: publisher.publish(message)
+        else: registry.deliver(self._state_key, publisher, message)
     
     def __setitem__(self, key, value):
         """
@@ -196,19 +464,31 @@ class Sphere(spheres_environment.Sphere):
         # This is necessary only to store a local copy of the value.
         super().__setitem__(key, value)
         
+        # Record the modification.
+        self._version += 1
+        
         # Ensure that the key corresponds to a valid object property.
-        if not self.is_object_property(key): raise KeyError
+        if key not in self._object_property_keys: raise KeyError(key)
         
-        # Generate a mapping between object property keys and message 
-        # generators.
-        message_map = dict(radius=lambda v: radius_message(data=value),
-                           position=lambda v: position_message(**value))
+        # If writes are coalesced, then store the value until the next flush. 
+        # Only the most recent value of each property is published.
+        if self._coalesce:
+            if not self._pending: self._guard_condition.trigger()
+            self._pending[key] = value
+            return
         
         # Publish the message.
-        topic = f'{self.key}/{key}'
-        message = message_map[key](value)
-        publisher = self._publisher_map[topic]
-        publisher.publish(message)
+        if self._state_publisher is None: self._emit[key](value)
+        else: self._publish_state()
+    
+    def __delitem__(self, key):
+        """ Remove a local property value, and record the modification. 
+        
+        No message is published, since property values cannot be removed 
+        remotely.
+        """
+        super().__delitem__(key)
+        self._version += 1
     
   
 
@@ -216,15 +496,61 @@ class Sphere(spheres_environment.Sphere):
 class Environment(spheres_environment.Environment):
     """ 
     
+    Arguments
+    ---------
+    node : rclpy.node.Node
+        A ROS2 node that provides an interface with a ROS2 graph. This node 
+        will be used to initialize publishers that enable remote interaction 
+        with a virtual environment.
+    intraprocess : bool
+        If True, then messages are delivered by directly invoking the 
+        callbacks of any matching `Server` subscriptions that exist in the 
+        same process and ROS2 context, instead of publishing them. Messages 
+        are only published when no such subscriptions exist. This bypasses 
+        message serialization and the ROS2 middleware, but messages 
+        delivered locally are not visible to other subscribers on the ROS2 
+        graph. Defaults to False.
+    coalesce : bool
+        If True, then object property values are not published immediately 
+        when set. Instead, the most recent value of each property is 
+        published the next time the ROS2 node is spun (or when `flush` is 
+        invoked). This ensures that at most one message is published per 
+        property per spin, regardless of how often the property is set. 
+        Defaults to False.
+    state_topic : bool
+        If True, then object property values are published together in a 
+        single message on the `{key}/state` topic of each object, instead of 
+        on one topic per property. No message is published until every object 
+        property has been set. The `Server` must be configured in the same 
+        way. Defaults to False.
+    
+    """
+    
+    __slots__ = ('_node', '_publisher_map', '_intraprocess', '_coalesce', 
+                 '_state_topic', '_version', '_repr_cache', '_repr_key')
+    """ Instance attributes are stored in slots, for faster attribute access.
     """
     
     object_type_map = dict(sphere=Sphere)
     
-    def __init__(self, node=None):
+    def __init__(self, node=None, intraprocess=False, coalesce=False, 
+                       state_topic=False):
         
         # Initialize an empty subscription map.
         self._publisher_map = {}
         
+        # Store the intra-process delivery, write coalescing, and object 
+        # state topic flags.
+        self._intraprocess = intraprocess
+        self._coalesce = coalesce
+        self._state_topic = state_topic
+        
+        # Initialize a counter of object modifications, and an empty 
+        # representation cache. See `__repr__`.
+        self._version = 0
+        self._repr_cache = None
+        self._repr_key = None
+        
         # Initialize properties if values are provided.
         if node:
             
@@ -266,28 +592,33 @@ class Environment(spheres_environment.Environment):
             objects contained therein -- to a ROS2 graph.
         """
         
+        # Prepare shorthand.
+        create_publisher = self.node.create_publisher
+        qos_profile = qos.SYSTEM_DEFAULT.value
+        
         # Initialize an `initialize` publisher.
         topic = 'initialize'
-        kwargs = dict(msg_type=spawn_message, 
-                      topic=topic, 
-                      qos_profile=qos.SYSTEM_DEFAULT.value)
-        self._publisher_map[topic] = self.node.create_publisher(**kwargs)
+        self._publisher_map[topic] \
+          = create_publisher(msg_type=spawn_message, 
+                             topic=topic, 
+                             qos_profile=qos_profile)
 
         # Initialize an `destroy` publisher.
         topic = 'destroy'
-        kwargs = dict(msg_type=spawn_message, 
-                      topic=topic, 
-                      qos_profile=qos.SYSTEM_DEFAULT.value)
-        self._publisher_map[topic] = self.node.create_publisher(**kwargs)
+        self._publisher_map[topic] \
+          = create_publisher(msg_type=spawn_message, 
+                             topic=topic, 
+                             qos_profile=qos_profile)
     
     def _destroy_publishers(self):
-        """ Destroy any subscriptions that have been initialized by the server.
+        """ Destroy any publishers that have been initialized by the client.
         """
         
-        # Destroy each of the elements of the local subscription mapping.
-        for (topic, subscription) in self._publisher_map.items():
-            assert self.node.destroy_publisher(subscription)
-            del self._publisher_map[topic]
+        # Destroy each of the elements of the local publisher mapping.
+        # The mapping is drained, since it cannot be modified while iterating.
+        while self._publisher_map:
+            (topic, publisher) = self._publisher_map.popitem()
+            assert self.node.destroy_publisher(publisher)
     
     def initialize_object(self, key, **kwargs):
         """
@@ -296,26 +627,79 @@ class Environment(spheres_environment.Environment):
         # Publish the request that the remote environment initialize an object.
         publisher = self._publisher_map['initialize']
         message = spawn_message(data=key)
-        publisher.publish(message)
-        
-        # Invoke superclass method with an additional argument.
-        # This argument is passed to the initialized object.
-        return super().initialize_object(key=key, node=self._node, **kwargs)
+        if not self._intraprocess: publisher.publish(message)
+        else: registry.deliver(registry.make_key(self._node, publisher), 
+                               publisher, 
+                               message)
+        
+        # Invoke superclass method with additional arguments.
+        # These arguments are passed to the initialized object.
+        obj = super().initialize_object(key=key, 
+                                        node=self._node, 
+                                        intraprocess=self._intraprocess,
+                                        coalesce=self._coalesce,
+                                        state_topic=self._state_topic,
+                                        **kwargs)
+        
+        # Return the new object.
+        return obj
         
     def destroy_object(self, key):
         """
         """
         
+        # Publish any pending values of the object before it is destroyed.
+        obj = self[key] if key in self else None
+        if obj is not None: obj.flush()
+        
         # Publish a request that the remote environment destroy an object.
         publisher = self._publisher_map['destroy']
         message = spawn_message(data=key)
-        publisher.publish(message)
+        if not self._intraprocess: publisher.publish(message)
+        else: registry.deliver(registry.make_key(self._node, publisher), 
+                               publisher, 
+                               message)
         
         # Invoke superclass method if the item exists.
         # The check is necessary in case the local virtual environment does 
         # not exactly match the remote environment.
         if key in self: super().destroy_object(key=key)
         
+        # Release the ROS2 resources of the object.
+        if obj is not None: obj._destroy_publishers()
+    
+    def __setitem__(self, key, value):
+        """ Add an object to the environment, and record the modification. """
+        super().__setitem__(key, value)
+        self._version += 1
+        
+    def __delitem__(self, key):
+        """ Remove an object from the environment, and record the 
+            modification. 
+        """
+        super().__delitem__(key)
+        self._version += 1
+        
+    def __repr__(self):
+        """ Representation of the environment and the objects therein.
+        
+        The representation is cached, and is only re-generated after an object 
+        is added or removed, or an object property is set. Modifications are 
+        detected by comparing modification counters, which is much cheaper 
+        than generating the representation.
+        """
+        versions = tuple((k, getattr(v, '_version', None)) 
+                         for (k, v) in self.items())
+        key = (self._version, versions)
+        if key != self._repr_key: 
+            (self._repr_key, self._repr_cache) = (key, super().__repr__())
+        return self._repr_cache
+        
+    def flush(self):
+        """ Publish any pending object property values. See `Sphere.flush`. 
+        """
+        for obj in self.values(): obj.flush()
+        
     def __del__(self):
         """ Destructor. """
         #self._destroy_publishers()
@@ -10,8 +10,29 @@
 
 
 # ROS2 imports
+from rclpy.qos import QoSPresetProfiles as qos
 from geometry_msgs.msg import Point as position_message
 from example_interfaces.msg import Float64 as radius_message
 from example_interfaces.msg import String as spawn_message
 from example_interfaces.msg import Float32 as default_message
+from example_interfaces.msg import Float64MultiArray as state_message
+
+# Order of the object property values in the `data` field of a state message.
+STATE_FIELDS = ('x', 'y', 'z', 'radius')
+
+# Mapping from object property keys to the message types and QoS profiles of 
+# the corresponding topics, as keyword arguments for 
+# `rclpy.node.Node.create_publisher` or `rclpy.node.Node.create_subscription`.
+# Clients and servers both use these records, since a best-effort publisher 
+# cannot be matched with a reliable subscription. Object properties are 
+# streaming state, so the best-effort sensor data profile is used.
+PROPERTY_TOPIC_RECORD_MAP \
+  = dict(position=dict(msg_type=position_message,
+                       qos_profile=qos.SENSOR_DATA.value),
+         radius=dict(msg_type=radius_message,
+                     qos_profile=qos.SENSOR_DATA.value))
+
+# Message type and QoS profile of the object state topic. See `STATE_FIELDS`.
+STATE_TOPIC_RECORD = dict(msg_type=state_message, 
+                          qos_profile=qos.SENSOR_DATA.value)
 
@@ -0,0 +1,204 @@
+""" Process-local registry of ROS2 subscription callbacks, used to bypass DDS
+    transport when publishers and subscriptions share a process.
+
+A `Server` registers each of its subscriptions here. A `Client` that has
+opted into intra-process delivery looks up the registry before publishing, and
+-- if subscriptions with a matching ROS2 context, fully-resolved topic name,
+and message type exist -- invokes their callbacks directly with the message,
+instead of publishing it. This avoids message serialization and the ROS2
+middleware entirely. Note that messages delivered in this way are not visible
+to any other subscribers on the ROS2 graph.
+
+Examples
+--------
+
+>>> import rclpy
+>>> import rclpy.node
+>>> rclpy.init()
+>>> node = rclpy.node.Node('registry')
+
+>>> received = []
+>>> subscription = node.create_subscription(msg_type=spawn_message,
+...                                         topic='initialize',
+...                                         callback=received.append,
+...                                         qos_profile=10)
+>>> register(node, subscription)
+
+>>> publisher = node.create_publisher(msg_type=spawn_message,
+...                                   topic='initialize',
+...                                   qos_profile=10)
+>>> key = make_key(node, publisher)
+>>> lookup(key) == (received.append,)
+True
+>>> deliver(key, publisher, spawn_message(data='cursor'))
+>>> [m.data for m in received]
+['cursor']
+
+>>> unregister(node, subscription)
+>>> lookup(key)
+()
+
+Subscriptions that are destroyed without being unregistered -- for example, 
+when the node is destroyed -- are ignored, and removed from the registry.
+
+>>> register(node, subscription)
+>>> node.destroy_node()
+>>> lookup(key)
+()
+
+>>> rclpy.shutdown()
+
+"""
+
+# Copyright 2022 Carnegie Mellon University Neuromechatronics Lab (a.whit)
+#
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at https://mozilla.org/MPL/2.0/.
+#
+# Contact: a.whit (nml@whit.contact)
+
+
+# Standard Python imports.
+import weakref
+import traceback
+
+# ROS2 imports.
+import rclpy.logging
+from rclpy.impl.implementation_singleton import rclpy_implementation as _rclpy
+
+# Local imports.
+from ros_spheres_environment.messages import *
+
+
+# Mapping from a (context, topic name, message type) record to a tuple of 
+# weak references to registered subscriptions.
+# Only weak references are held, so that the registry does not keep nodes -- 
+# or the environments referenced by subscription callbacks -- alive.
+# Tuples are replaced -- rather than modified -- on registration, so that a 
+# registry entry can safely be iterated while the registry changes.
+_LOCAL_REGISTRY = {}
+
+# Logger for exceptions raised by subscription callbacks. See `deliver`.
+_logger = rclpy.logging.get_logger('ros_spheres_environment.registry')
+
+
+def make_key(node, entity):
+    """ Generate a registry key for a ROS2 publisher or subscription.
+    
+    The key requires a query of the topic name, so publishers should generate 
+    it once, and pass it to `lookup` or `deliver` for every message.
+    """
+    return (node.context, entity.topic_name, entity.msg_type)
+
+
+def register(node, subscription):
+    """ Register the callback of a ROS2 subscription for local delivery.
+    
+    Arguments
+    ---------
+    node : rclpy.node.Node
+        The ROS2 node that created the subscription.
+    subscription : rclpy.subscription.Subscription
+        A subscription with a callback to be invoked by local publishers.
+    """
+    key = make_key(node, subscription)
+    _LOCAL_REGISTRY[key] \
+      = _LOCAL_REGISTRY.get(key, ()) + (weakref.ref(subscription),)
+
+
+def unregister(node, subscription):
+    """ Remove a ROS2 subscription from the registry, if it has been 
+        registered.
+    """
+    _prune(make_key(node, subscription), exclude=subscription)
+
+
+def _is_live(subscription):
+    """ Test whether a subscription exists and has not been destroyed -- for 
+        example, by `rclpy.node.Node.destroy_node`.
+    
+    This is a constant-time check of the subscription handle, in the same way 
+    that the `rclpy` executors check the entities that they wait on.
+    """
+    if subscription is None: return False
+    try:
+        with subscription.handle: return True
+    except _rclpy.InvalidHandle: return False
+
+
+def _prune(key, exclude=None):
+    """ Remove stale records -- and, optionally, a specific subscription -- 
+        from a registry entry.
+    """
+    references = tuple(r for r in _LOCAL_REGISTRY.get(key, ()) 
+                       if (r() is not exclude) and _is_live(r()))
+    if references: _LOCAL_REGISTRY[key] = references
+    else: _LOCAL_REGISTRY.pop(key, None)
+
+
+def lookup(key):
+    """ Retrieve the callbacks of live, registered subscriptions that match a 
+        registry key.
+    
+    Arguments
+    ---------
+    key : tuple
+        A registry key, generated by `make_key` for a ROS2 publisher.
+    
+    Returns
+    -------
+    tuple
+        Callbacks of local subscriptions with the same ROS2 context, 
+        fully-resolved topic name, and message type as the publisher. Empty if 
+        no such subscriptions exist.
+    """
+    _prune(key)
+    return tuple(r().callback for r in _LOCAL_REGISTRY.get(key, ()))
+
+
+def deliver(key, publisher, message):
+    """ Deliver a message directly to any matching local subscriptions, or 
+        publish it via a ROS2 publisher if none exist.
+    
+    The registry entry is iterated directly, so delivery requires no 
+    allocations, and a constant-time liveness check per subscription. Stale 
+    records are only removed when they are encountered.
+    
+    As with messages delivered via the ROS2 middleware, exceptions raised by 
+    subscription callbacks are not propagated to the publisher. Instead, they 
+    are logged, and delivery continues with the remaining subscriptions.
+    
+    Arguments
+    ---------
+    key : tuple
+        The registry key of the publisher. See `make_key`.
+    publisher : rclpy.publisher.Publisher
+        A publisher to be used if no live local subscriptions exist.
+    message : object
+        A ROS2 message instance.
+    """
+    
+    # Invoke the callback of each live subscription.
+    (delivered, stale) = (False, False)
+    for reference in _LOCAL_REGISTRY.get(key, ()):
+        subscription = reference()
+        if not _is_live(subscription): 
+            stale = True
+            continue
+        delivered = True
+        try: subscription.callback(message)
+        except Exception: _logger.error(traceback.format_exc())
+    
+    # Remove stale records, and publish the message if it was not delivered.
+    if stale: _prune(key)
+    if not delivered: publisher.publish(message)
+
+
+# Main.
+if __name__ == '__main__':
+    import doctest
+    doctest.testmod()
+
+
+
@@ -77,9 +77,106 @@ been updated.
 {'cursor': {'position': {'x': 1.0, 'y': 2.0, 'z': 3.0}}}
 
 
-Clean up the ROS2 node and shut down the ROS2 interface.
+Clean up the ROS2 node.
 
 >>> node.destroy_node()
+
+Limit the rate at which the environment is updated. Define an environment that 
+records each update.
+
+>>> updates = []
+>>> class RecordingEnvironment(spheres_environment.Environment):
+...     def update(self):
+...         updates.append(None)
+...         super().update()
+>>> environment = RecordingEnvironment()
+
+Create a server that updates the environment at most 10 times per second, and 
+a client that delivers messages to the server directly, within this process. 
+The environment is updated immediately when an object is initialized.
+
+>>> from ros_spheres_environment.client import Environment as Client
+>>> server_node = rclpy.node.Node('server')
+>>> server = Server(node=server_node, environment=environment, update_hz=10.0)
+>>> client_node = rclpy.node.Node('client')
+>>> client = Client(node=client_node, intraprocess=True)
+>>> client.initialize_object('ball')
+>>> len(updates)
+1
+
+Property messages are applied to the environment, but only mark it as 
+modified.
+
+>>> client['ball'].radius = 0.5
+>>> client['ball'].position = (1.0, 2.0, 3.0)
+>>> environment
+{'ball': {'radius': 0.5, 'position': {'x': 1.0, 'y': 2.0, 'z': 3.0}}}
+>>> len(updates)
+1
+
+A single timer period updates the environment once. Subsequent periods have no 
+effect, unless the environment is modified again.
+
+>>> rclpy.spin_once(server_node, timeout_sec=0.2)
+>>> len(updates)
+2
+>>> rclpy.spin_once(server_node, timeout_sec=0.2)
+>>> len(updates)
+2
+
+Clean up the ROS2 nodes.
+
+>>> client_node.destroy_node()
+>>> server_node.destroy_node()
+
+Spin a server node in a dedicated thread. Messages are then queued, and only 
+applied to the environment when the `process` method is invoked.
+
+>>> environment = spheres_environment.Environment()
+>>> server_node = rclpy.node.Node('server')
+>>> server = Server(node=server_node, environment=environment)
+>>> client_node = rclpy.node.Node('client')
+>>> client = Client(node=client_node, intraprocess=True)
+>>> server.start()
+
+>>> client.initialize_object('ball')
+>>> 'ball' in environment
+False
+>>> server.process()
+>>> environment
+{'ball': {}}
+
+>>> client['ball'].radius = 0.5
+>>> environment
+{'ball': {}}
+>>> server.process()
+>>> environment
+{'ball': {'radius': 0.5}}
+
+Stop the dedicated thread. Any remaining messages are applied, and messages 
+are once again applied as they are received.
+
+>>> client['ball'].radius = 0.25
+>>> server.stop()
+>>> environment
+{'ball': {'radius': 0.25}}
+
+Replace the environment. The subscriptions for the previous environment are 
+destroyed, and new subscriptions are created.
+
+>>> previous = environment
+>>> environment = spheres_environment.Environment()
+>>> server.environment = environment
+>>> client.initialize_object('cursor')
+>>> environment
+{'cursor': {}}
+>>> previous
+{'ball': {'radius': 0.25}}
+
+Clean up the ROS2 nodes and shut down the ROS2 interface.
+
+>>> client_node.destroy_node()
+>>> server_node.destroy_node()
 >>> rclpy.shutdown()
 
 """
@@ -93,16 +190,54 @@ Clean up the ROS2 node and shut down the ROS2 interface.
 # Contact: a.whit (nml@whit.contact)
 
 
+# Standard Python imports.
+import sys
+import queue
+import threading
+import functools
+
 # ROS2 imports
 import rclpy.node
+import rclpy.executors
 from rclpy.qos import QoSPresetProfiles as qos
-from rosidl_runtime_py import message_to_ordereddict
+from rclpy.callback_groups import ReentrantCallbackGroup
 
 # spheres_environment imports
 import spheres_environment
 
 # Local imports.
 from ros_spheres_environment.messages import *
+from ros_spheres_environment import registry
+
+
+# Message types with a single `data` field that holds the property value.
+SCALAR_MSG_TYPES = {radius_message, spawn_message, default_message}
+
+# Functions that set an object property from the content of a message.
+# One of these is bound to an object and property key -- via 
+# `functools.partial` -- when a subscription is created.
+def _set_scalar(obj, key, message):
+    setattr(obj, key, message.data)
+
+def _set_point(obj, key, message):
+    setattr(obj, key, {'x': message.x, 'y': message.y, 'z': message.z})
+
+def _set_state(obj, key, message):
+    values = dict(zip(STATE_FIELDS, message.data))
+    obj.position = {k: values[k] for k in ('x', 'y', 'z')}
+    obj.radius = values['radius']
+
+def _set_generic(obj, key, message):
+    from rosidl_runtime_py import message_to_ordereddict
+    value = message_to_ordereddict(message)
+    value = value['data'] if (list(value) == ['data']) else value
+    setattr(obj, key, value)
+
+# Mapping from message types to property setter functions.
+# Message types that are not otherwise recognized use the generic setter.
+PROPERTY_SETTER_MAP = {position_message: _set_point,
+                       state_message: _set_state,
+                       **{t: _set_scalar for t in SCALAR_MSG_TYPES}}
 
 
 # Server class.
@@ -124,6 +259,32 @@ class Server:
     environment : spheres_environment.base.Environment
         A class with data structures and methods that define an environment in 
         which objects interact.
+    update_hz : float
+        Maximum rate (in Hz) at which the environment is updated in response 
+        to object property messages. If specified, property messages only 
+        mark the environment as modified, and a ROS2 timer invokes the 
+        environment `update` method -- at most once per period -- when 
+        needed. This coalesces bursts of property messages into a single 
+        update. Note that the timer is then one of the callbacks processed 
+        when the node is spun. If not specified (the default), the 
+        environment is updated after every property message.
+    state_topic : bool
+        If True, then a single subscription is created for each object, on 
+        the `{key}/state` topic, instead of one subscription per object 
+        property. Each state message carries all object property values -- 
+        in the order defined by `messages.STATE_FIELDS` -- so that only one 
+        message is received and dispatched per object update. Defaults to 
+        False, in which case the per-property topics are used.
+    callback_group : rclpy.callback_groups.CallbackGroup
+        Callback group for the object property subscriptions. Defaults to a 
+        new `ReentrantCallbackGroup`, so that -- when the node is spun with a 
+        `rclpy.executors.MultiThreadedExecutor` -- messages for distinct 
+        object properties can be dispatched concurrently. The environment 
+        itself is not thread-safe, so each modification and update of the 
+        environment is serialized by a lock; only message handling outside 
+        of the environment proceeds in parallel. The object initialization 
+        and destruction subscriptions remain in the default (mutually 
+        exclusive) callback group of the node.
     
     """
     
@@ -141,22 +302,57 @@ class Server:
         subscriptions for the topic.
     """
     
-    DEFAULT_PROPERTY_MESSAGE_MAP = dict(position=position_message,
-                                        radius=radius_message)
-    """ Mapping from a spheres environment object property key to a ROS2 
-        message type. Used for preparing arguments to 
-        `rclpy.node.Node.create_publisher` or 
+    DEFAULT_PROPERTY_MESSAGE_MAP = PROPERTY_TOPIC_RECORD_MAP
+    """ Mapping from a spheres environment object property key to a set of 
+        keyword arguments -- a ROS2 message type and QoS profile -- to be 
+        passed, by default, to `rclpy.node.Node.create_publisher` or 
         `rclpy.node.Node.create_subscription` when initializing publishers or 
-        subscriptions for the topic.
+        subscriptions for the topic. These are shared with the client. See 
+        `messages.PROPERTY_TOPIC_RECORD_MAP`.
+    """
+    
+    DEFAULT_STATE_PARAMETER_RECORD = STATE_TOPIC_RECORD
+    """ Default keyword arguments to be passed to 
+        `rclpy.node.Node.create_subscription` when initializing an object state 
+        subscription. See the `state_topic` argument.
     """
     
     def __init__(self, node=None, 
                        environment=None,
-                       topic_parameter_map={}):
+                       topic_parameter_map={},
+                       update_hz=None,
+                       state_topic=False,
+                       callback_group=None):
         
         # Initialize an empty subscription map.
         self._subscription_map = {}
         
+        # Initialize an empty mapping from object keys to the topics of the 
+        # corresponding object property subscriptions.
+        self._object_topic_map = {}
+        
+        # Store the object state topic flag.
+        self._state_topic = state_topic
+        
+        # Initialize the callback group for object property subscriptions.
+        if callback_group is None: callback_group = ReentrantCallbackGroup()
+        self._callback_group = callback_group
+        
+        # Initialize a lock that serializes modifications of the environment, 
+        # in case callbacks are invoked concurrently.
+        self._lock = threading.RLock()
+        
+        # Initialize the environment update state.
+        self._update_hz = update_hz
+        self._update_timer = None
+        self._dirty = False
+        
+        # Initialize the state of the dedicated spin thread.
+        # See the `start` method.
+        self._executor = None
+        self._thread = None
+        self._queue = None
+        
         # Iniitalize the topic parameter map.
         self._topic_parameter_map = {**self.DEFAULT_TOPIC_PARAMETER_MAP,
                                      **topic_parameter_map}
@@ -243,7 +439,7 @@ class Server:
         topic = f'initialize'
         kwargs = {**self.DEFAULT_TOPIC_PARAMETER_RECORD,
                   'topic': topic,
-                  'callback': lambda m: self.initialize_object(key=m.data), #make_callback(self.initialize_object),
+                  'callback': self._on_initialize,
                   **self._topic_parameter_map.get(topic, {})}
         
         # Initialize topic shorthand.
@@ -251,13 +447,13 @@ class Server:
         
         # Initialize the subscription.
         self._subscription_map[topic] \
-          = self.node.create_subscription(**kwargs)
+          = self._create_subscription(**kwargs)
 
         # Prepare keyword arguments for an object destruction topic subscription.
         topic = f'destroy'
         kwargs = {**self.DEFAULT_TOPIC_PARAMETER_RECORD,
                   'topic': topic,
-                  'callback': lambda m: self.destroy_object(key=m.data), #make_callback(self.destroy_object),
+                  'callback': self._on_destroy,
                   **self._topic_parameter_map.get(topic, {})}
         
         # Initialize topic shorthand.
@@ -265,16 +461,98 @@ class Server:
         
         # Initialize the subscription.
         self._subscription_map[topic] \
-          = self.node.create_subscription(**kwargs)
+          = self._create_subscription(**kwargs)
+        
+        # Initialize a timer for coalescing environment updates, if requested.
+        if self._update_hz:
+            self._update_timer \
+              = self.node.create_timer(1.0 / self._update_hz, 
+                                       self._on_update_timer)
 
     def _destroy_subscriptions(self):
         """ Destroy any subscriptions that have been initialized by the server.
         """
         
         # Destroy each of the elements of the local subscription mapping.
-        for (topic, subscription) in self._subscription_map.items():
-            assert self.node.destroy_subscription(subscription)
-            del self._subscription_map[topic]
+        # The mapping is drained, since it cannot be modified while iterating.
+        while self._subscription_map:
+            (topic, subscription) = self._subscription_map.popitem()
+            self._destroy_subscription(subscription)
+        self._object_topic_map.clear()
+        
+        # Destroy the environment update timer, if one has been initialized.
+        if self._update_timer is not None:
+            assert self.node.destroy_timer(self._update_timer)
+            self._update_timer = None
+    
+    def _create_subscription(self, **kwargs):
+        """ Create a ROS2 subscription, and register it for intra-process 
+            delivery.
+        """
+        subscription = self.node.create_subscription(**kwargs)
+        registry.register(self.node, subscription)
+        return subscription
+    
+    def _destroy_subscription(self, subscription):
+        """ Unregister and destroy a ROS2 subscription. """
+        registry.unregister(self.node, subscription)
+        assert self.node.destroy_subscription(subscription)
+    
+    def _handoff(self, function, argument):
+        """ Invoke a function, or -- if the server is spinning in a dedicated 
+            thread -- queue it to be invoked by the `process` method.
+        """
+        # The queue is referenced only once, since it might be cleared by 
+        # another thread. See the `stop` method.
+        pending = self._queue
+        if pending is not None: 
+            pending.put((function, argument, False))
+            return
+        with self._lock: function(argument)
+    
+    def _on_initialize(self, message):
+        """ Initialize an object in response to a ROS2 message. """
+        self._handoff(self.initialize_object, message.data)
+    
+    def _on_destroy(self, message):
+        """ Destroy an object in response to a ROS2 message. """
+        self._handoff(self.destroy_object, message.data)
+    
+    def _on_property_message(self, setter, message):
+        """ Set an object property from a message, and request an environment 
+            update.
+        """
+        pending = self._queue
+        if pending is not None: 
+            pending.put((setter, message, True))
+            return
+        with self._lock: setter(message)
+        self._request_update()
+    
+    def _request_update(self):
+        """ Update the environment, or mark it for update by the timer. """
+        if self._update_timer is not None:
+            self._dirty = True
+            return
+        with self._lock: self._environment.update()
+    
+    def _on_update_timer(self):
+        """ Update the environment, if necessary, on every timer period. 
+            Updates are left to the `process` method if the server is spinning 
+            in a dedicated thread.
+        """
+        if self._queue is None: self._flush()
+    
+    def _flush(self):
+        """ Update the environment, if it has been modified since the last 
+            update.
+        """
+        # The flag is reset before the update, so that modifications made 
+        # during the update are not lost.
+        with self._lock:
+            if not self._dirty: return
+            self._dirty = False
+            self._environment.update()
     
     def initialize_object(self, key, type_key=None, **kwargs):
         """ Initialize a new object in the environment.
@@ -305,48 +583,49 @@ class Server:
         # Define a function for generating a ROS2 callback that passes 
         # message data to a property of the corresponding object in the 
         # virtual environment.
-        # This default callback should not be used for scalar property types.
-        # UPDATE: 
-        to_dict = lambda m: message_to_ordereddict(m)
-        to_value = lambda d: d['data'] if (list(d) == ['data']) else d
-        #def to_dict(msg):
-        #    d = message_to_ordereddict(m)
-        #    d = {key: d['data']} 
-        #        if (list(d) == ['data']) 
-        #        else {f'{key}/{k}': v for (k, v) in d.items()}
-        #    return d
-        #make_callback \
-        #  = lambda k: lambda m: setattr(obj, k, to_value(to_dict(m)))
-        #  #= lambda k: lambda m: setattr(obj, k, to_dict(m))
-        #  #= lambda k: lambda m: obj.set(**to_dict(m))
-        def make_callback(key):
-            def callback(message):
-                value = message_to_ordereddict(message)
-                value = value['data'] if (list(value) == ['data']) else value
-                setattr(obj, key, value)
-                self._environment.update() # !
-            return callback
+        # The message type is known at subscription time, so the callback is 
+        # specialized by binding a setter for the message type.
+        def make_callback(key, msg_type):
+            setter = PROPERTY_SETTER_MAP.get(msg_type, _set_generic)
+            setter = functools.partial(setter, obj, key)
+            return functools.partial(self._on_property_message, setter)
+        
+        # Initialize a record of the topics subscribed to for this object.
+        topics = self._object_topic_map[key] = []
+        
+        # Define the default parameters of the subscriptions for this object. 
+        # Either a single subscription is created for the state of the object, 
+        # or one subscription is created for each object property.
+        record_map = {'state': self.DEFAULT_STATE_PARAMETER_RECORD}
+        if not self._state_topic:
+            record_map = {k: self.DEFAULT_PROPERTY_MESSAGE_MAP[k] 
+                          for k in obj.object_properties}
         
         # Iterate through the object properties.
-        for property_key in obj.object_properties:
-            
-            # Retrieve the default message type for the object property.
-            msg_type = self.DEFAULT_PROPERTY_MESSAGE_MAP[property_key]
+        for (property_key, record) in record_map.items():
             
             # Prepare keyword arguments.
             topic = f'{key}/{property_key}'
             kwargs = {**self.DEFAULT_TOPIC_PARAMETER_RECORD,
-                      'msg_type': msg_type,
+                      **record,
                       'topic': topic,
-                      'callback': make_callback(property_key),
+                      'callback_group': self._callback_group,
                       **self._topic_parameter_map.get(topic, {})}
             
             # Initialize topic shorthand.
-            topic = kwargs['topic']
+            # The topic string is interned, since it is used as a key.
+            topic = kwargs['topic'] = sys.intern(kwargs['topic'])
+            topics.append(topic)
+            
+            # Prepare a callback specialized to the message type, unless a 
+            # callback has been provided in the topic parameter map.
+            if 'callback' not in kwargs:
+                msg_type = kwargs['msg_type']
+                kwargs['callback'] = make_callback(property_key, msg_type)
             
             # Initialize a subscription.
             self._subscription_map[topic] \
-              = self.node.create_subscription(**kwargs)
+              = self._create_subscription(**kwargs)
         
         # Update the environment.
         self._environment.update()
@@ -360,20 +639,12 @@ class Server:
         # Initialize shorthand.
         obj = self._environment[key]
         
-        # Iterate through the object properties.
-        for property_key in obj.object_properties:
-            
-            # Prepare keyword arguments.
-            topic = f'{key}/{property_key}'
+        # Iterate through the topics of the object property subscriptions.
+        for topic in self._object_topic_map.pop(key):
             
-            # Retrieve the subscription.
-            subscription = self._subscription_map[topic] #pop
-            
-            # Destroy the subscription.
-            assert self.node.destroy_subscription(subscription)
-            
-            # Remove the subscription pair from the mapping.
-            del self._subscription_map[topic] 
+            # Remove the subscription from the mapping, and destroy it.
+            subscription = self._subscription_map.pop(topic)
+            self._destroy_subscription(subscription)
         
         # Delete the object from the environment.
         del self._environment[key]
@@ -381,6 +652,79 @@ class Server:
         # Update the environment.
         self._environment.update()
     
+    def start(self):
+        """ Spin the server node in a dedicated thread.
+        
+        ROS2 messages are then received and dispatched concurrently with the 
+        thread that owns the environment. Message callbacks do not modify the 
+        environment directly. Instead, they are queued, and applied when the 
+        `process` method is invoked -- typically once per iteration of the 
+        simulation loop on the thread that owns the environment.
+        """
+        
+        # Ensure that the server is not already spinning.
+        assert self._thread is None
+        
+        # Initialize a thread-safe queue for handing off messages.
+        self._queue = queue.SimpleQueue()
+        
+        # Initialize an executor that spins only the server node.
+        self._executor \
+          = rclpy.executors.SingleThreadedExecutor(context=self.node.context)
+        self._executor.add_node(self.node)
+        
+        # Spin the executor in a daemon thread.
+        self._thread = threading.Thread(target=self._executor.spin, 
+                                        daemon=True)
+        self._thread.start()
+        
+    def stop(self):
+        """ Stop the dedicated spin thread, and process any queued messages.
+        """
+        
+        # Ensure that the server is spinning.
+        assert self._thread is not None
+        
+        # Stop the executor and wait for the thread to finish.
+        self._executor.shutdown()
+        self._thread.join()
+        self._executor = None
+        self._thread = None
+        
+        # Revert to direct dispatch, and then process any remaining messages.
+        # The queue is swapped out before it is drained, so that subsequent 
+        # messages are dispatched directly, rather than queued and never 
+        # processed.
+        (pending, self._queue) = (self._queue, None)
+        self._process(pending)
+        
+    def process(self):
+        """ Apply any messages queued by the dedicated spin thread to the 
+            environment, and update the environment once if it has changed.
+        
+        This method has no effect unless the server has been started. See the 
+        `start` method.
+        """
+        
+        # Apply any queued messages, if the server has been started.
+        pending = self._queue
+        if pending is not None: self._process(pending)
+        
+    def _process(self, pending):
+        """ Apply the messages in a queue, and update the environment. """
+        
+        # Apply each queued message.
+        # Object initialization and destruction update the environment 
+        # directly, so only property messages mark it as modified.
+        while True:
+            try: (function, argument, dirty) = pending.get_nowait()
+            except queue.Empty: break
+            function(argument)
+            if dirty: self._dirty = True
+        
+        # Update the environment, if necessary.
+        self._flush()
+    
     def __del__(self):
         """ Destructor. """
         #self._destroy_subscriptions()